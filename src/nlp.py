@@ -1,40 +1,71 @@
 import re
-import spacy
 from functools import lru_cache
 
-# Supported language codes and spaCy models
-LANG_MODELS = {
-    'en': 'en_core_web_sm',
-    'es': 'es_core_news_sm',
-    'ja': 'ja_core_news_sm',
-}
+# Supported language codes (anything else falls back to English)
+SUPPORTED_LANGS = ('en', 'es', 'ja')
+
+# Sentence-final punctuation used by the sentencizer
+SENTENCE_PUNCT = ['.', '!', '?', '\u3002', '\uff01', '\uff1f']
+
+_END_PUNCT = "".join(SENTENCE_PUNCT)
+
+# Precompiled patterns
+# Numbering schemes: 1, 1.1, 1.2.3 | Roman numerals like I., II. | letter + parenthesis like A), B)
+_NUM_RE = re.compile(r'^(?:\d+(?:\.\d+)*|[IVXLCDM]+\.|[A-Z]\))')
 
 @lru_cache(maxsize=3)
 def get_nlp(lang_code):
     """
-    Load and cache the appropriate spaCy model for the given language code.
+    Build and cache a lightweight spaCy pipeline for the given language code:
+    a blank tokenizer plus a rule-based sentencizer. Heading detection only
+    needs sentence boundaries and token counts, so no trained components are loaded.
     Defaults to English if unsupported.
+    spaCy is imported here so it is only loaded once a full-sentence check is needed.
     """
-    model = LANG_MODELS.get(lang_code, LANG_MODELS['en'])
+    import spacy
+
+    if lang_code not in SUPPORTED_LANGS:
+        lang_code = 'en'
     try:
-        return spacy.load(model)
+        nlp = spacy.blank(lang_code)
     except Exception:
-        return spacy.load(LANG_MODELS['en'])
+        nlp = spacy.blank('en')
+    nlp.add_pipe("sentencizer", config={"punct_chars": SENTENCE_PUNCT})
+    return nlp
 
-# --- Language-aware helpers ---
-def is_full_sentence(text, lang_code='en'):
+def parse_texts(texts, lang_code='en', batch_size=256):
     """
-    Returns True if text has at least one full sentence with >2 tokens and ends with punctuation.
-    Uses the appropriate spaCy model for the language.
+    Run the language pipeline over many texts at once with nlp.pipe.
+    Returns a list of spaCy Docs in the same order as texts.
     """
     nlp = get_nlp(lang_code)
-    doc = nlp(text)
+    return list(nlp.pipe(texts, batch_size=batch_size))
+
+# --- Language-aware helpers ---
+def is_full_sentence(doc):
+    """
+    Returns True if a parsed Doc has at least one full sentence with >2 tokens and ends with punctuation.
+    Parse texts in bulk with parse_texts() first.
+    """
     for sent in doc.sents:
-        tokens = [t.text for t in sent if not t.is_space]
-        if len(tokens) > 2 and re.search(r"[.!?。！？]$", sent.text.strip()):
+        # Count non-space tokens, stopping as soon as there are more than 2
+        n = 0
+        for token in sent:
+            if not token.is_space:
+                n += 1
+                if n > 2:
+                    break
+        if n <= 2:
+            continue
+        # Last non-space token (exists since n > 2)
+        i = len(sent) - 1
+        while sent[i].is_space:
+            i -= 1
+        if sent[i].text[-1] in _END_PUNCT:
             return True
     return False
 
+@lru_cache(maxsize=4096)
 def is_all_caps(text, lang_code='en'):
     """
     Returns True if text is all uppercase letters (ignoring non-letters).
@@ -42,9 +73,16 @@ def is_all_caps(text, lang_code='en'):
     """
     if lang_code == 'ja':
         return False  # Not meaningful for Japanese
-    letters = [c for c in text if c.isalpha()]
-    return bool(letters) and all(c.isupper() for c in letters)
+    # Every letter must be uppercase, including uncased ones (str.isupper() would skip "日本")
+    has_letters = False
+    for c in text:
+        if c.isalpha():
+            if not c.isupper():
+                return False
+            has_letters = True
+    return has_letters
 
+@lru_cache(maxsize=4096)
 def is_title_case(text, lang_code='en'):
     """
     Returns True if the text is in strict title case.
@@ -52,14 +90,12 @@ def is_title_case(text, lang_code='en'):
     """
     if lang_code == 'ja':
         return False
+    # Only purely alphabetic words are checked (e.g. "Ontario’s" is skipped);
+    # single letters like "A" or "I" are not title case
     words = [w for w in text.split() if w.isalpha()]
-    if not words:
-        return False
-    for w in words:
-        if not (w[0].isupper() and w[1:].islower()):
-            return False
-    return True
+    return bool(words) and all(len(w) > 1 and w.istitle() for w in words)
 
+@lru_cache(maxsize=4096)
 def starts_with_bullet(text):
     """
     Returns True if the text starts with a bullet or dash character.
@@ -67,6 +103,7 @@ def starts_with_bullet(text):
     bullets = {'\u2022', '\u25cf', '-', '*', '\u25aa', '\u2023', '\u2013', '\u2014'}
     return text and text[0] in bullets
 
+@lru_cache(maxsize=4096)
 def is_short(text, max_words=12, max_chars=70, lang_code='en'):
     """
     Returns True if text is short enough to be a heading candidate.
@@ -76,6 +113,7 @@ def is_short(text, max_words=12, max_chars=70, lang_code='en'):
         return len(text) <= max_chars
     return len(text) <= max_chars and len(text.split()) <= max_words
 
+@lru_cache(maxsize=4096)
 def uppercase_ratio(text, lang_code='en'):
     """
     Returns ratio of uppercase letters to total letters.
@@ -83,23 +121,19 @@ def uppercase_ratio(text, lang_code='en'):
     """
     if lang_code == 'ja':
         return 0
-    letters = [c for c in text if c.isalpha()]
-    if not letters:
+    up = n = 0
+    for c in text:
+        if c.isalpha():
+            n += 1
+            up += c.isupper()
+    if not n:
         return 0
-    return sum(1 for c in letters if c.isupper()) / len(letters)
+    return up / n
 
+@lru_cache(maxsize=4096)
 def starts_with_numbering(text):
     """
     Detect if text starts with numbering schemes like:
     1., 1.1, I., A), etc.
     """
-    numbering_patterns = [
-        r'^\d+(\.\d+)*',    # e.g. 1, 1.1, 1.2.3
-        r'^[IVXLCDM]+\.',   # Roman numerals like I., II., III.
-        r'^[A-Z]\)',        # Letter + parenthesis like A), B)
-    ]
-    text = text.strip()
-    for pat in numbering_patterns:
-        if re.match(pat, text):
-            return True
-    return False
+    return _NUM_RE.match(text.strip()) is not None
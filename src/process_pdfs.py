@@ -1,39 +1,118 @@
 import fitz  # PyMuPDF
 import json
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import groupby, islice
 from pathlib import Path
+import os
 import sys
-from langdetect import detect
-import re
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+try:
+    import gcld3
+except ImportError:  # gcld3 needs protobuf to build; fall back to langdetect
+    gcld3 = None
+import numpy as np
 
-from nlp import is_all_caps, is_title_case, starts_with_bullet, is_short, is_full_sentence, uppercase_ratio
+from nlp import is_all_caps, is_title_case, starts_with_bullet, is_short, is_full_sentence, uppercase_ratio, parse_texts
+
+# Reusable CLD3 language identifier
+_CLD = gcld3.NNetLanguageIdentifier(min_num_bytes=0, max_num_bytes=1000) if gcld3 else None
+
+# Profiles loaded for the langdetect fallback (a subset of the 55 shipped, to cut memory)
+LANGDETECT_PROFILES = ('en', 'es', 'ja', 'fr', 'de', 'it', 'pt', 'zh-cn', 'zh-tw', 'ko', 'ar', 'hi', 'ru', 'id', 'bn')
+
+@lru_cache(maxsize=1)
+def _langdetect_factory():
+    factory = DetectorFactory()
+    profiles = [
+        (Path(PROFILES_DIRECTORY) / lang).read_text(encoding="utf-8")
+        for lang in LANGDETECT_PROFILES
+    ]
+    factory.load_json_profile(profiles)
+    return factory
+
+# Default "dict" extraction flags minus image blocks: only text blocks are returned
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+@dataclass
+class Blocks:
+    """Text spans of a PDF as parallel arrays, one entry per span."""
+    texts: list          # stripped span text
+    fonts: list          # font names
+    sizes: np.ndarray    # float32[n] font sizes
+    flags: np.ndarray    # int32[n] PyMuPDF span flags
+    bbox: np.ndarray     # float32[n, 4] (x0, y0, x1, y1)
+    pages: np.ndarray    # int32[n] 1-based page numbers
+
+    def __len__(self):
+        return len(self.texts)
+
+    @classmethod
+    def from_spans(cls, texts, fonts, sizes, flags, bbox, pages):
+        return cls(
+            texts=texts,
+            fonts=fonts,
+            sizes=np.array(sizes, dtype=np.float32),
+            flags=np.array(flags, dtype=np.int32),
+            bbox=np.array(bbox, dtype=np.float32).reshape(-1, 4),
+            pages=np.array(pages, dtype=np.int32),
+        )
+
+    @classmethod
+    def concat(cls, chunks):
+        if not chunks:
+            return cls.from_spans([], [], [], [], [], [])
+        return cls(
+            texts=[t for c in chunks for t in c.texts],
+            fonts=[f for c in chunks for f in c.fonts],
+            sizes=np.concatenate([c.sizes for c in chunks]),
+            flags=np.concatenate([c.flags for c in chunks]),
+            bbox=np.concatenate([c.bbox for c in chunks]),
+            pages=np.concatenate([c.pages for c in chunks]),
+        )
+
+    def take(self, idx):
+        return Blocks(
+            texts=[self.texts[i] for i in idx.tolist()],
+            fonts=[self.fonts[i] for i in idx.tolist()],
+            sizes=self.sizes[idx],
+            flags=self.flags[idx],
+            bbox=self.bbox[idx],
+            pages=self.pages[idx],
+        )
+
+    def has_text(self):
+        return np.fromiter(map(bool, self.texts), dtype=bool, count=len(self.texts))
 
 def extract_blocks_with_metadata(pdf_path):
+    # Yields one Blocks per page, so a whole document is never held in memory
     doc = fitz.open(pdf_path)
-    blocks = []
     for page_num in range(len(doc)):
         page = doc[page_num]
-        for block in page.get_text("dict")["blocks"]:
-            if block["type"] == 0:  # text block
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        blocks.append({
-                            "text": span["text"].strip(),
-                            "font": span["font"],
-                            "size": span["size"],
-                            "flags": span["flags"],
-                            "bbox": span["bbox"],
-                            "page": page_num + 1,
-                            "origin": (span["bbox"][0], span["bbox"][1])
-                        })
-    return blocks
-
-def detect_language(blocks):
+        texts, fonts, sizes, flags, bbox = [], [], [], [], []
+        for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"]:
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    texts.append(span["text"].strip())
+                    fonts.append(span["font"])
+                    sizes.append(span["size"])
+                    flags.append(span["flags"])
+                    bbox.append(span["bbox"])
+        yield Blocks.from_spans(texts, fonts, sizes, flags, bbox, [page_num + 1] * len(texts))
+
+def detect_language(texts):
     # Concatenate first N non-empty blocks for language detection
-    texts = [b["text"] for b in blocks if b["text"]]
-    sample = " ".join(texts[:20])
+    sample = " ".join(islice(filter(None, texts), 20))
     try:
-        lang = detect(sample)
+        if _CLD is not None:
+            result = _CLD.FindLanguage(text=sample)
+            lang = result.language if result.is_reliable else 'en'
+        else:
+            detector = _langdetect_factory().create()
+            detector.append(sample)
+            lang = detector.detect()
         print(f"[INFO] Detected language: {lang}")
         return lang
     except Exception as e:
@@ -41,49 +120,53 @@ def detect_language(blocks):
         return 'en'
 
 # --- DEBUG: Print font sizes and sample texts ---
-def debug_font_sizes(blocks):
-    font_samples = defaultdict(list)
-    for b in blocks:
-        if b["text"] and len(font_samples[b["size"]]) < 3:
-            font_samples[b["size"]].append(b["text"])
+def collect_font_samples(font_samples, blocks):
+    for size, text in zip(blocks.sizes.tolist(), blocks.texts):
+        if text and len(font_samples[size]) < 3:
+            font_samples[size].append(text)
+
+def debug_font_sizes(font_samples):
     print("[DEBUG] Font sizes and sample texts:")
     for size in sorted(font_samples.keys(), reverse=True):
         print(f"  Size {size}: {font_samples[size]}")
 
 # --- FIXED TITLE EXTRACTION: Use 24.0 font size ---
+def _collapse_runs(text):
+    # One groupby pass collapsing runs of >2 identical word chars (same set as re's \w).
+    # Whitespace runs need no handling here since clean_repetitions re-splits the text.
+    out = []
+    for c, g in groupby(text):
+        n = sum(1 for _ in g)
+        out.append(c if n > 2 and (c.isalnum() or c == '_') else c * n)
+    return ''.join(out)
+
 def clean_repetitions(text):
     # Collapse more than 2 repeated letters to 1 (e.g., "Reeeequest" -> "Request")
-    text = re.sub(r'(\w)\1{2,}', r'\1', text)
-    # Collapse more than 2 spaces
-    text = re.sub(r'\s{2,}', ' ', text)
+    # and runs of whitespace to a single space
+    text = _collapse_runs(text)
     # Remove repeated words/phrases (e.g., "Proposal Proposal" -> "Proposal")
-    words = text.split()
-    seen = set()
-    result = []
-    for word in words:
-        if word not in seen:
-            result.append(word)
-            seen.add(word)
-    return ' '.join(result)
-
-def detect_title(blocks, lang_code='en'):
-    first_page_blocks = [b for b in blocks if b["page"] == 1 and b["text"]]
-    if not first_page_blocks:
+    return ' '.join(dict.fromkeys(text.split()))
+
+def detect_title(blocks, lang_code='en', page1_mask=None, max_size=None):
+    # page1_mask / max_size may be passed in when already computed by the caller
+    first_page = (blocks.pages == 1) & blocks.has_text() if page1_mask is None else page1_mask
+    if not first_page.any():
         return ""
     # Find the largest font size on the first page
-    max_size = max(b["size"] for b in first_page_blocks)
+    if max_size is None:
+        max_size = blocks.sizes[first_page].max()
     # Allow a small tolerance for font size
-    title_blocks = [b for b in first_page_blocks if abs(b["size"] - max_size) < 0.5]
+    idx = np.flatnonzero(first_page & (np.abs(blocks.sizes - max_size) < 0.5))
     # Sort by y-position (top of the page)
-    title_blocks = sorted(title_blocks, key=lambda b: b["origin"][1])
+    idx = idx[np.argsort(blocks.bbox[idx, 1], kind="stable")]
     # Concatenate all title block texts
-    title = " ".join(b["text"] for b in title_blocks)
+    title = " ".join(blocks.texts[i] for i in idx)
     # Clean up repetitions and duplicate words
     title = clean_repetitions(title)
     return title.strip()
 
 # --- FIXED HEADING LEVELS BASED ON FONT SIZES FROM DEBUG ---
-def compute_font_stats(blocks):
+def compute_font_stats():
     # Hardcode based on debug output
     font_map = {
         "H1": 20.04,
@@ -93,8 +176,7 @@ def compute_font_stats(blocks):
     print(f"[DEBUG] Font map used for headings: {font_map}")
     return font_map
 
-def heading_level(block, font_stats):
-    size = block["size"]
+def heading_level(size, font_stats):
     # Use a tolerance for float comparison
     if abs(size - font_stats["H1"]) < 0.1:
         return "H1"
@@ -102,45 +184,101 @@ def heading_level(block, font_stats):
         return "H2"
     elif abs(size - font_stats["H3"]) < 0.1:
         return "H3"
-    return None
+    return ""
+
+def heading_levels(sizes, font_stats):
+    # Level of every block at once ("" where the size matches no heading).
+    # A document has few distinct sizes, so check each one once and broadcast.
+    uniq, inverse = np.unique(sizes, return_inverse=True)
+    lut = np.array([heading_level(s, font_stats) for s in uniq.tolist()], dtype="<U2")
+    return lut[inverse]
 
 # --- IMPROVED HEADING CANDIDATE USING NLP HELPERS ---
-def is_heading_candidate(block, lang_code='en'):
-    text = block["text"]
+def is_heading_candidate(text, lang_code='en'):
+    # Cheap checks only; the full-sentence check (spaCy) runs batched and last in extract_outline
     # Loosened: allow up to 14 words and 80 chars
     if not text or starts_with_bullet(text) or not is_short(text, max_words=14, max_chars=80, lang_code=lang_code):
         return False
-    if is_full_sentence(text, lang_code=lang_code):
-        return False
     if is_all_caps(text, lang_code=lang_code) or is_title_case(text, lang_code=lang_code) or uppercase_ratio(text, lang_code=lang_code) > 0.5:
         return True
     return False
 
-def extract_outline(blocks, lang_code='en'):
-    font_stats = compute_font_stats(blocks)
-    outline = []
-    for block in blocks:
-        level = heading_level(block, font_stats)
-        if level and is_heading_candidate(block, lang_code=lang_code):
-            outline.append({
-                "level": level,
-                "text": block["text"],
-                "page": block["page"] -1
-            })
-    print(f"[DEBUG] Outline candidates: {[o['text'] for o in outline]}")
-    print(f"[DEBUG] Outline entries: {len(outline)}")
+def extract_outline(blocks, lang_code='en', font_stats=None):
+    if font_stats is None:
+        font_stats = compute_font_stats()
+    levels = heading_levels(blocks.sizes, font_stats)
+    # Pass 1: visit only blocks whose font size maps to a level, then apply cheap text predicates
+    candidates = []
+    for i in np.flatnonzero(levels != "").tolist():
+        if is_heading_candidate(blocks.texts[i], lang_code=lang_code):
+            candidates.append((str(levels[i]), i))
+    # Pass 2: parse each distinct candidate text once, in one batch
+    # (running headers and footers repeat on every page); spaCy loads only if there are candidates
+    texts = list(dict.fromkeys(blocks.texts[i] for _, i in candidates))
+    full_sentence = dict(zip(texts, map(is_full_sentence, parse_texts(texts, lang_code=lang_code)))) if texts else {}
+    # Preallocate one slot per candidate; full sentences stay None and are dropped
+    outline = [None] * len(candidates)
+    for n, (level, i) in enumerate(candidates):
+        text = blocks.texts[i]
+        if full_sentence[text]:
+            continue
+        outline[n] = {
+            "level": level,
+            "text": text,
+            "page": int(blocks.pages[i]) -1
+        }
+    outline = [o for o in outline if o is not None]
+    if __debug__ and os.environ.get("DEBUG_OUTLINE"):
+        print(f"[DEBUG] Outline candidates: {[o['text'] for o in outline]}")
+        print(f"[DEBUG] Outline entries: {len(outline)}")
     return outline
 
+def fused_extract(pdf_path):
+    """
+    Single streaming pass over the PDF's pages. Keeps only the first page,
+    the language sample, font samples and heading-sized blocks, then
+    returns (title, outline, lang_code).
+    """
+    font_stats = compute_font_stats()
+    first_page = None
+    page1_mask = None
+    first_page_max_size = None
+    lang_sample = []
+    first_texts = []
+    font_samples = defaultdict(list)
+    outline_chunks = []
+    n_blocks = 0
+    for blocks in extract_blocks_with_metadata(pdf_path):
+        if first_page is None:
+            # Title inputs are derived once here, while the first page is being scanned
+            first_page = blocks
+            page1_mask = blocks.has_text()
+            if page1_mask.any():
+                first_page_max_size = blocks.sizes[page1_mask].max()
+        n_blocks += len(blocks)
+        if len(first_texts) < 5:
+            first_texts.extend(blocks.texts[:5 - len(first_texts)])
+        if len(lang_sample) < 20:
+            lang_sample.extend(islice(filter(None, blocks.texts), 20 - len(lang_sample)))
+        collect_font_samples(font_samples, blocks)
+        idx = np.flatnonzero(heading_levels(blocks.sizes, font_stats) != "")
+        if idx.size:
+            outline_chunks.append(blocks.take(idx))
+    print(f"[INFO] Extracted {n_blocks} blocks from {pdf_path}")
+    if first_page is None:
+        first_page = Blocks.concat([])
+        page1_mask = first_page.has_text()
+    if n_blocks > 0:
+        print(f"[INFO] First 5 blocks: {first_texts}")
+    debug_font_sizes(font_samples)
+    lang_code = detect_language(lang_sample)
+    title = detect_title(first_page, lang_code=lang_code, page1_mask=page1_mask, max_size=first_page_max_size)
+    outline = extract_outline(Blocks.concat(outline_chunks), lang_code=lang_code, font_stats=font_stats)
+    return title, outline, lang_code
+
 def process_pdf(pdf_path, output_json):
     print(f"[INFO] Processing {Path(pdf_path).name} -> {Path(output_json).name}")
-    blocks = extract_blocks_with_metadata(pdf_path)
-    print(f"[INFO] Extracted {len(blocks)} blocks from {pdf_path}")
-    if len(blocks) > 0:
-        print(f"[INFO] First 5 blocks: {[b['text'] for b in blocks[:5]]}")
-    debug_font_sizes(blocks)
-    lang_code = detect_language(blocks)
-    title = detect_title(blocks, lang_code=lang_code)
-    outline = extract_outline(blocks, lang_code=lang_code)
+    title, outline, lang_code = fused_extract(pdf_path)
     print(f"[INFO] Selected title: {title}")
     print(f"[INFO] Outline: {outline}")
     result = {
@@ -151,12 +289,16 @@ def process_pdf(pdf_path, output_json):
     with open(output_json, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
 
+def _worker(pdf_file, output_dir):
+    # Runs in a pool process; spaCy pipelines load lazily there via get_nlp
+    process_pdf(pdf_file, output_dir / f"{pdf_file.stem}.json")
+
 def process_pdfs(input_dir, output_dir):
     output_dir.mkdir(parents=True, exist_ok=True)
     pdf_files = list(input_dir.glob("*.pdf"))
-    for pdf_file in pdf_files:
-        output_file = output_dir / f"{pdf_file.stem}.json"
-        process_pdf(pdf_file, output_file)
+    # Each PDF is independent, so process them in parallel across cores
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(_worker, pdf_files, [output_dir] * len(pdf_files)))
     print("Completed processing all PDFs.")
 
 if __name__ == "__main__":